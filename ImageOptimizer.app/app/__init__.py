@@ -1,15 +1,29 @@
-from flask import Flask
+import os
+import cv2
+from flask import Flask, send_from_directory
 from flask_cors import CORS
 from .routes import main_bp
 from .config import Config
 
+# Cache lifetime (seconds) for /favicon.ico: one week. The file is not content-addressed,
+# so it is not marked immutable like processed images.
+_FAVICON_MAX_AGE = 7 * 24 * 3600
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    cv2.setNumThreads(app.config['OPENCV_THREADS'])
     
     # Enable CORS for React frontend
     CORS(app, resources={r"/*": {"origins": "*"}})
     
     app.register_blueprint(main_bp)
 
+    # Serve the real favicon from static/ with a long cache lifetime so browsers rarely ask again
+    app.add_url_rule('/favicon.ico', endpoint='favicon',
+                     view_func=lambda: send_from_directory(app.static_folder, 'favicon.ico',
+                                                           max_age=_FAVICON_MAX_AGE))
+
     return app
@@ -1,11 +1,20 @@
 import os
 import secrets
+from pathlib import Path
 
 # Project root: directory containing the "app" package (parent of this file's dir)
-_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+_ROOT = Path(__file__).resolve().parent.parent
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or secrets.token_hex(16)
     # Absolute path so uploads are always in project root /uploads (e.g. ImageOptimizer.app/uploads)
-    UPLOAD_FOLDER = os.path.join(_ROOT, 'uploads')
+    UPLOAD_FOLDER = str(_ROOT / 'uploads')
+    # Also write processed images to UPLOAD_FOLDER so they can be fetched from /uploads/<filename>.
+    # Off by default: /upload returns the processed image inline as a data URL.
+    SAVE_PROCESSED_IMAGES = os.environ.get('SAVE_PROCESSED_IMAGES', '').lower() in ('1', 'true', 'yes')
+    # Threads OpenCV may use inside one resize/decode; it releases the GIL, so request threads run in parallel too
+    OPENCV_THREADS = int(os.environ.get('OPENCV_THREADS') or os.cpu_count() or 1)
+    # Processed images with at least this many pixels are JPEG-encoded on the GPU when nvImageCodec
+    # and a CUDA device are available (default: 1920x1080 output, i.e. a 4K upload)
+    GPU_ENCODE_MIN_PIXELS = int(os.environ.get('GPU_ENCODE_MIN_PIXELS') or 1920 * 1080)
     # Add database configs, etc.
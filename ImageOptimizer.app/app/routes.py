@@ -12,30 +12,269 @@ Routes
     Renders the index page (HTML).
 - ``POST /upload``
     Accepts an image file and optional ``quality`` form field; resizes
-    to 50%, saves as JPEG, and returns JSON with success message,
-    processed filename, and size reduction stats.
+    to 50%, encodes as JPEG (or AVIF/WebP when the ``Accept`` header
+    explicitly lists ``image/avif``/``image/webp`` and OpenCV can encode
+    it), and returns JSON with success message,
+    processed filename, the processed image as a ``data:`` URL, and
+    size reduction stats.
 - ``/uploads/<filename>``
-    Serves files from the configured upload directory (processed images).
-- ``/favicon.ico``
-    Returns 204 No Content to avoid favicon 404s.
+    Serves files from the configured upload directory (processed images
+    saved when ``SAVE_PROCESSED_IMAGES`` is enabled).
 
 Configuration
 -------------
 The app must set ``config['UPLOAD_FOLDER']`` to the directory used for
-temporary and processed image storage.
+processed image storage; ``create_app`` creates it at startup.
+``config['GPU_ENCODE_MIN_PIXELS']`` sets the output size at which the
+GPU encoder is used. Processed images are only written there when
+``config['SAVE_PROCESSED_IMAGES']`` is true. Uploads are decoded in
+memory and never written to disk.
 
 Dependencies
 ------------
-Uses OpenCV (cv2) for resize/compression, Pillow (PIL) for image
-validation, and Flask for routing and request handling.
+Uses OpenCV (cv2) and NumPy for decode/resize/compression, Pillow (PIL)
+for header-only size checks and EXIF orientation, and Flask for routing
+and request handling. Uploads are validated by their file signature and
+their header dimensions (at most ``PIL.Image.MAX_IMAGE_PIXELS``); the
+decoder rejects malformed data.
+JPEG decode/encode goes through libjpeg-turbo (PyTurboJPEG) when the
+package and its native library are installed, falling back to OpenCV.
+Large outputs are encoded on the GPU with nvImageCodec (nvJPEG) when it
+is installed and the CUDA driver reports a device at startup.
 """
+import base64
+import ctypes
+import hashlib
+import io
+import logging
 import os
+import threading
 import cv2
-from PIL import Image, UnidentifiedImageError
+import numpy as np
+from PIL import Image
 from flask import Blueprint, request, current_app, jsonify, render_template, send_from_directory
+from werkzeug.exceptions import NotFound
+
+_logger = logging.getLogger(__name__)
+
+try:
+    from turbojpeg import TurboJPEG, TJFLAG_FASTDCT, TJPF_BGR, TJSAMP_420
+    # Same pixel limit as the header check in upload(), in case a decode is ever reached without it
+    _jpeg = TurboJPEG(max_pixels=Image.MAX_IMAGE_PIXELS or 0)
+except (ImportError, OSError, RuntimeError) as e:
+    # PyTurboJPEG or the native libjpeg-turbo (>= 3.0) library is unavailable; use OpenCV instead
+    _logger.warning("TurboJPEG unavailable, JPEG decode/encode falls back to OpenCV: %s", e)
+    _jpeg = None
+
+
+def _cuda_device_count():
+    """
+    Returns the number of CUDA devices reported by the driver, or 0 if there is no usable driver.
+    """
+    try:
+        libcuda = ctypes.CDLL('nvcuda.dll' if os.name == 'nt' else 'libcuda.so.1')
+        count = ctypes.c_int()
+        if libcuda.cuInit(0) != 0 or libcuda.cuDeviceGetCount(ctypes.byref(count)) != 0:
+            return 0
+        return count.value
+    except (OSError, AttributeError):
+        return 0
+
+
+try:
+    from nvidia import nvimgcodec
+except ImportError:
+    nvimgcodec = None
+
+# Only touch the CUDA driver when nvImageCodec is installed, so plain CPU deployments never call cuInit
+_gpu_encoder = None
+if nvimgcodec is not None and _cuda_device_count() > 0:
+    try:
+        # GPU-only backend: never let nvImageCodec quietly fall back to its own CPU encoder
+        _gpu_encoder = nvimgcodec.Encoder(backends=[nvimgcodec.Backend(nvimgcodec.GPU_ONLY)])
+    except Exception:
+        # nvImageCodec cannot use the device; encode on the CPU
+        _gpu_encoder = None
+
+_ALLOWED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+_ALLOWED_MIME_TYPES = frozenset(('image/png', 'image/jpeg', 'image/gif'))
+
+# Highest quality encoded with libjpeg-turbo's fast integer DCT. Up to here (including the
+# default of 50) its rounding error is far below the quantization step; above it, use the accurate DCT.
+_FASTDCT_MAX_QUALITY = 90
+
+_JPEG_MAGIC = b'\xff\xd8\xff'
+# Leading bytes of every accepted format: JPEG, PNG, GIF87a/GIF89a
+_IMAGE_MAGICS = (_JPEG_MAGIC, b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a')
+
+# Per-thread scratch buffers reused across requests for resize and encode output.
+# Anything larger than the cap is allocated per request so one huge upload
+# does not pin that much memory in every worker thread.
+_scratch = threading.local()
+_MAX_SCRATCH_BYTES = 64 * 1024 * 1024
+
+# EXIF orientation tag value -> transform that brings the pixels upright.
+# cv2.imdecode applies this itself; TurboJPEG does not.
+_EXIF_ORIENTATION_OPS = {
+    2: lambda im: cv2.flip(im, 1),
+    3: lambda im: cv2.rotate(im, cv2.ROTATE_180),
+    4: lambda im: cv2.flip(im, 0),
+    5: lambda im: cv2.transpose(im),
+    6: lambda im: cv2.rotate(im, cv2.ROTATE_90_CLOCKWISE),
+    7: lambda im: cv2.flip(cv2.transpose(im), -1),
+    8: lambda im: cv2.rotate(im, cv2.ROTATE_90_COUNTERCLOCKWISE),
+}
+
+def _cv2_can_encode(ext, params):
+    """
+    Returns whether this OpenCV build has an encoder for ``ext`` (e.g. '.avif').
+    """
+    try:
+        return cv2.imencode(ext, np.zeros((8, 8, 3), np.uint8), params)[0]
+    except cv2.error:
+        return False
+
+
+# Output formats offered instead of JPEG, most preferred first: (MIME type, extension, quality flag).
+# Only formats this OpenCV build can encode are listed.
+_ALT_OUTPUT_FORMATS = tuple(
+    (mime, ext, flag) for mime, ext, flag in (
+        ('image/avif', 'avif', getattr(cv2, 'IMWRITE_AVIF_QUALITY', None)),
+        ('image/webp', 'webp', cv2.IMWRITE_WEBP_QUALITY),
+    ) if flag is not None and _cv2_can_encode('.' + ext, [flag, 50])
+)
+
+# Cache lifetime (seconds) for files served from /uploads/<filename>: one year
+_PROCESSED_MAX_AGE = 31536000
 
 main_bp = Blueprint('main', __name__)
 
+
+def _scratch_buffer(name, nbytes):
+    """
+    Returns this thread's scratch bytearray called ``name`` with at least ``nbytes``,
+    growing it when needed, or None if ``nbytes`` is over the cap.
+    """
+    if nbytes > _MAX_SCRATCH_BYTES:
+        return None
+    buf = getattr(_scratch, name, None)
+    if buf is None or len(buf) < nbytes:
+        buf = bytearray(nbytes)
+        setattr(_scratch, name, buf)
+    return buf
+
+
+def _exif_orientation(buf):
+    """
+    Returns the EXIF orientation of an encoded image, or 1 if it has none.
+    Pillow only parses the header here; pixel data is not decoded.
+    """
+    try:
+        with Image.open(io.BytesIO(buf)) as im:
+            return im.getexif().get(0x0112, 1)
+    except Exception:
+        return 1
+
+
+def _decode_half_size(buf):
+    """
+    Decodes an encoded image to a BGR ndarray at 50% of its width and height,
+    or returns None if it cannot be decoded.
+    JPEGs are scaled by libjpeg-turbo inside the IDCT when available, which skips
+    most of the IDCT work and the separate resize pass. Everything else is decoded
+    with cv2.imdecode and then resized.
+    """
+    if _jpeg is not None and buf.startswith(_JPEG_MAGIC):
+        try:
+            image = _jpeg.decode(buf, pixel_format=TJPF_BGR, scaling_factor=(1, 2))
+        except (OSError, ValueError):
+            # e.g. CMYK JPEGs (OSError), or lossless JPEGs and images over PyTurboJPEG's
+            # max_pixels limit (ValueError); OpenCV can still decode or reject them
+            pass
+        else:
+            op = _EXIF_ORIENTATION_OPS.get(_exif_orientation(buf))
+            return op(image) if op else image
+
+    image = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    new_width = int(width * 0.5)
+    new_height = int(height * 0.5)
+    nbytes = new_height * new_width * 3
+    scratch = _scratch_buffer('resize', nbytes)
+    # INTER_AREA averages each 2x2 block at this exact factor: no aliasing, and OpenCV
+    # has an integer-scale fast path for it.
+    if scratch is None:
+        return cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+    dst = np.frombuffer(scratch, np.uint8, count=nbytes).reshape(new_height, new_width, 3)
+    return cv2.resize(image, (new_width, new_height), dst=dst, interpolation=cv2.INTER_AREA)
+
+
+def _encode_jpeg_gpu(image, quality):
+    """
+    Encodes a BGR ndarray as JPEG on the GPU with nvJPEG (via nvImageCodec) and returns the bytes.
+    Raises if the encode fails, so the caller can fall back to the CPU.
+    """
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    params = nvimgcodec.EncodeParams(quality=max(quality, 1),
+                                     chroma_subsampling=nvimgcodec.ChromaSubsampling.CSS_420)
+    encoded = _gpu_encoder.encode(nvimgcodec.as_image(rgb), 'jpeg', params=params)
+    if encoded is None:
+        # nvImageCodec reports a failed encode by returning None rather than raising
+        raise RuntimeError('nvImageCodec returned no data')
+    return encoded
+
+
+def _encode_jpeg(image, quality, gpu_min_pixels=None):
+    """
+    Encodes a BGR ndarray as JPEG and returns the bytes-like result.
+    Images of at least ``gpu_min_pixels`` pixels are encoded on the GPU when nvImageCodec is available.
+    Otherwise uses libjpeg-turbo with 4:2:0 chroma subsampling (and the fast DCT up to
+    ``_FASTDCT_MAX_QUALITY``) when available, else cv2.imencode.
+    The TurboJPEG result is a view of a per-thread buffer, valid until this thread encodes again.
+    """
+    if (_gpu_encoder is not None and gpu_min_pixels is not None
+            and image.shape[0] * image.shape[1] >= gpu_min_pixels):
+        try:
+            return _encode_jpeg_gpu(image, quality)
+        except Exception as e:
+            current_app.logger.warning("GPU JPEG encode failed, falling back to CPU: %s", e)
+    if _jpeg is not None:
+        params = dict(quality=max(quality, 1), jpeg_subsample=TJSAMP_420, pixel_format=TJPF_BGR,
+                      flags=TJFLAG_FASTDCT if quality <= _FASTDCT_MAX_QUALITY else 0)
+        scratch = _scratch_buffer('encode', _jpeg.buffer_size(image, TJSAMP_420))
+        if scratch is None:
+            return _jpeg.encode(image, **params)
+        out, size = _jpeg.encode(image, dst=scratch, **params)
+        return memoryview(out)[:size]
+    return _encode_cv2(image, '.jpg', [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+
+def _encode_cv2(image, ext, params):
+    """
+    Encodes a BGR ndarray with cv2.imencode in the format given by ``ext`` (e.g. '.webp').
+    """
+    ok, encoded = cv2.imencode(ext, image, params)
+    if not ok:
+        raise ValueError(f'{ext} encoding failed')
+    return encoded
+
+
+def _negotiate_output_format(accept):
+    """
+    Picks an alternative output format from the request's Accept header.
+    Returns a ``(mime_type, extension, quality_flag)`` entry of ``_ALT_OUTPUT_FORMATS``,
+    or None for JPEG. Only explicitly listed types count: the ``*/*`` sent by fetch()
+    would otherwise match every format.
+    """
+    explicit = {mime for mime, q in accept if q > 0}
+    for output_format in _ALT_OUTPUT_FORMATS:
+        if output_format[0] in explicit:
+            return output_format
+    return None
+
+
 @main_bp.route('/')
 def index():
     """
@@ -48,14 +287,15 @@ def upload():
     """
     Handles the upload of an image file via a POST request.
     This function accepts an image file from the request, processes it with OpenCV (resizes to 50%),
-    saves the processed image to a local directory, and returns a JSON response.
+    encodes it as JPEG, or as AVIF/WebP if the Accept header asks for it, and returns the processed
+    image inline in a JSON response.
     Returns:
-        JSON: A dictionary containing a success message and processed image path if successful.
+        JSON: A dictionary containing a success message, processed image filename and data URL if successful.
         JSON: A dictionary containing an error message and appropriate status code on failure.
     Notes:
         - The uploaded image is processed using OpenCV to resize to 50% of original size.
-        - The processed image is saved to the directory specified by the 'UPLOAD_FOLDER' key
-          in the application's configuration.
+        - The processed image is also saved to the directory specified by the 'UPLOAD_FOLDER' key
+          in the application's configuration when 'SAVE_PROCESSED_IMAGES' is enabled.
         - The image file is retrieved from the 'image' key in the request's files.
     """
     try:
@@ -64,48 +304,38 @@ def upload():
         if not image_file:
             return jsonify({'error': 'No image uploaded!'}), 400
 
-        # Ensure upload folder exists
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        try:
-            os.makedirs(upload_folder, exist_ok=True)
-        except OSError as e:
-            current_app.logger.error(f"Failed to create upload folder: {e}")
-            return jsonify({'error': 'Server error: Unable to prepare upload directory.'}), 500
-
-        # Check if the uploaded file is an image
-        allowed_extensions = {"png", "jpg", "jpeg", "gif"}
-        allowed_mime_types = {"image/png", "image/jpeg", "image/gif"}
-        def allowed_file(filename):
-            return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
-
-        if not allowed_file(image_file.filename):
+        # Check if the uploaded file is an image (by name and declared type) before reading it
+        if (not (image_file.filename or '').lower().endswith(_ALLOWED_EXTENSIONS)
+                or image_file.mimetype not in _ALLOWED_MIME_TYPES):
             return jsonify({'error': 'Invalid file type! Only image files are allowed.'}), 400
 
-        # Save temp file and verify it's an image using Pillow (content-based)
-        temp_path = os.path.join(upload_folder, 'temp_' + image_file.filename)
+        # Read the upload once into memory straight from Werkzeug's parsed stream (never saved
+        # to UPLOAD_FOLDER) and check its signature (content-based); the decoder rejects
+        # anything malformed past the header
         try:
-            image_file.save(temp_path)
+            image_file.stream.seek(0)
+            buf = image_file.stream.read()
         except Exception as e:
-            current_app.logger.error(f"Failed to save temp file: {e}")
-            return jsonify({'error': 'Server error: Unable to save uploaded file.'}), 500
+            current_app.logger.error("Failed to read uploaded file: %s", e)
+            return jsonify({'error': 'Server error: Unable to read uploaded file.'}), 500
 
-        try:
-            with Image.open(temp_path) as im:
-                im.verify()  # verify that it's an image
-        except (UnidentifiedImageError, OSError) as e:
-            current_app.logger.warning(f"Uploaded file is not a valid image: {e}")
-            try:
-                os.remove(temp_path)
-            except OSError:
-                pass
+        if not buf.startswith(_IMAGE_MAGICS):
+            current_app.logger.warning("Uploaded file is not a valid image: unrecognised signature")
             return jsonify({'error': 'Uploaded file is not a valid image!'}), 400
+
+        # Reject decompression bombs from the header alone, before any decoder allocates pixels
+        try:
+            with Image.open(io.BytesIO(buf)) as im:
+                width, height = im.size
+        except Image.DecompressionBombError as e:
+            current_app.logger.warning("Rejected oversized image: %s", e)
+            return jsonify({'error': 'Image dimensions are too large!'}), 400
         except Exception as e:
-            current_app.logger.error(f"Error verifying image file: {e}")
-            try:
-                os.remove(temp_path)
-            except OSError:
-                pass
-            return jsonify({'error': 'Server error: Unable to verify file type.'}), 500
+            current_app.logger.warning("Uploaded file is not a valid image: %s", e)
+            return jsonify({'error': 'Uploaded file is not a valid image!'}), 400
+        if Image.MAX_IMAGE_PIXELS and width * height > Image.MAX_IMAGE_PIXELS:
+            current_app.logger.warning("Rejected oversized image: %sx%s", width, height)
+            return jsonify({'error': 'Image dimensions are too large!'}), 400
 
         # Get quality parameter from form, default to 50
         try:
@@ -115,57 +345,60 @@ def upload():
         except ValueError:
             quality = 50
 
-        # Process with OpenCV: resize to 50%
+        # Decode and resize to 50%
         try:
-            image = cv2.imread(temp_path)
-            if image is None:
-                os.remove(temp_path)
+            image_out = _decode_half_size(buf)
+            if image_out is None:
                 return jsonify({'error': 'Invalid image file!'}), 400
-
-            height, width = image.shape[:2]
-            new_width = int(width * 0.5)
-            new_height = int(height * 0.5)
-            resized_image = cv2.resize(image, (new_width, new_height))
         except Exception as e:
-            current_app.logger.error(f"OpenCV processing error: {e}")
-            os.remove(temp_path)
+            current_app.logger.error("OpenCV processing error: %s", e)
             return jsonify({'error': 'Server error: Unable to process image.'}), 500
 
-        # Always save as JPEG with the specified quality for compression
-        compression_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
-        output_ext = 'jpg'
-
-        # Save processed image
-        base_name = os.path.splitext(image_file.filename)[0]
-        processed_filename = f'processed_{base_name}.{output_ext}'
-        processed_path = os.path.join(upload_folder, processed_filename)
+        # Encode as AVIF/WebP if the client explicitly accepts it, else JPEG, with the specified quality
+        output_format = _negotiate_output_format(request.accept_mimetypes)
         try:
-            cv2.imwrite(processed_path, resized_image, compression_params)
+            if output_format is None:
+                output_mime, output_ext = 'image/jpeg', 'jpg'
+                encoded = _encode_jpeg(image_out, quality, current_app.config['GPU_ENCODE_MIN_PIXELS'])
+            else:
+                output_mime, output_ext, quality_flag = output_format
+                encoded = _encode_cv2(image_out, '.' + output_ext, [quality_flag, max(quality, 1)])
         except Exception as e:
-            current_app.logger.error(f"Failed to save processed image: {e}")
-            os.remove(temp_path)
-            return jsonify({'error': 'Server error: Unable to save processed image.'}), 500
+            current_app.logger.error("Failed to encode processed image: %s", e)
+            return jsonify({'error': 'Server error: Unable to process image.'}), 500
+
+        # Save processed image only if persistence is enabled; it is returned inline either way.
+        # The content hash in the name means a saved file never changes, so it can be cached forever.
+        base_name = os.path.splitext(image_file.filename)[0]
+        content_hash = hashlib.blake2b(encoded, digest_size=6).hexdigest()
+        processed_filename = f'processed_{base_name}_{content_hash}.{output_ext}'
+        if current_app.config['SAVE_PROCESSED_IMAGES']:
+            processed_path = os.path.join(current_app.config['UPLOAD_FOLDER'], processed_filename)
+            try:
+                with open(processed_path, 'wb') as f:
+                    f.write(encoded)
+            except Exception as e:
+                current_app.logger.error("Failed to save processed image: %s", e)
+                return jsonify({'error': 'Server error: Unable to save processed image.'}), 500
 
         # Get file sizes
-        original_size = os.path.getsize(temp_path)
-        processed_size = os.path.getsize(processed_path)
+        original_size = len(buf)
+        processed_size = len(encoded)
         size_reduction = ((original_size - processed_size) / original_size) * 100 if original_size > 0 else 0
 
-        # Clean up temp file
-        try:
-            os.remove(temp_path)
-        except OSError as e:
-            current_app.logger.warning(f"Failed to remove temp file: {e}")
-
-        return jsonify({
+        response = jsonify({
             'message': 'Image uploaded and processed successfully!',
             'processed_image': processed_filename,
+            'processed_image_data': f'data:{output_mime};base64,' + base64.b64encode(encoded).decode('ascii'),
             'original_size': original_size,
             'processed_size': processed_size,
             'size_reduction_percent': round(size_reduction, 2)
         })
+        # The output format depends on the Accept header
+        response.vary.add('Accept')
+        return response
     except Exception as e:
-        current_app.logger.error(f"Unexpected error in upload route: {e}")
+        current_app.logger.error("Unexpected error in upload route: %s", e)
         return jsonify({'error': 'An unexpected error occurred. Please try again.'}), 500
 
 @main_bp.route('/uploads/<filename>')
@@ -174,19 +407,17 @@ def uploaded_file(filename):
     Serves uploaded files from the upload folder.
     This route allows the browser to access processed images by their filename.
     It uses Flask's send_from_directory to securely serve files from the configured upload directory.
+    Processed filenames are content-addressed, so responses are cached as immutable for a year
+    and revalidated with ETag / If-None-Match.
     """
     try:
-        return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
-    except FileNotFoundError:
-        current_app.logger.warning(f"File not found: {filename}")
+        response = send_from_directory(current_app.config['UPLOAD_FOLDER'], filename,
+                                       conditional=True, max_age=_PROCESSED_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+    except (NotFound, FileNotFoundError):
+        current_app.logger.warning("File not found: %s", filename)
         return jsonify({'error': 'File not found.'}), 404
     except Exception as e:
-        current_app.logger.error(f"Error serving file {filename}: {e}")
+        current_app.logger.error("Error serving file %s: %s", filename, e)
         return jsonify({'error': 'Server error: Unable to serve file.'}), 500
-
-@main_bp.route('/favicon.ico')
-def favicon():
-    """
-    Handles favicon requests by returning 204 No Content to avoid 404 errors.
-    """
-    return '', 204
@@ -18,7 +18,7 @@
  * API:
  * - Backend base URL from `import.meta.env.VITE_API_URL` (default: http://localhost:5000)
  * - POST /upload with FormData: `image` (file), `quality` (number)
- * - Processed image URL: `${API_URL}/uploads/${processed_image}`
+ * - Processed image: `processed_image_data` (data URL), falling back to `${API_URL}/uploads/${processed_image}`
  */
 import { useState } from 'react'
 import './App.css'
@@ -118,7 +118,7 @@ function App() {
       setMessage(data.message || 'Image uploaded successfully!')
       // Set the processed image URL, filename (for download), and file sizes
       if (data.processed_image) {
-        setProcessedImage(`${API_URL}/uploads/${data.processed_image}`)
+        setProcessedImage(data.processed_image_data || `${API_URL}/uploads/${data.processed_image}`)
         setProcessedFilename(data.processed_image)
       }
       if (data.original_size !== undefined) {